@@ -1,29 +1,37 @@
 from dotenv import load_dotenv
 import schedule
-import time
 import random
+import time
 from datetime import datetime, timedelta
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
+from selenium.common.exceptions import TimeoutException, NoSuchElementException, WebDriverException
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+import queue
 import os
+import atexit
+import signal
+import urllib.request
+import functools
+import hashlib
+import re
+import threading
+import concurrent.futures
 from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
 
 # Load environment variables
 load_dotenv()
 
 # Configure logging
-LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
-LOG_LEVEL = logging.DEBUG
+LOG_FORMAT = '%(asctime)s - %(threadName)s - %(levelname)s - %(message)s'
+LOG_LEVEL = logging.DEBUG if os.getenv('CALCLICK_DEBUG') == '1' else logging.INFO
 
 # Root logger
 logger = logging.getLogger()
-logger.setLevel(logging.DEBUG)
+logger.setLevel(LOG_LEVEL)
 
 # Console handler
 console_handler = logging.StreamHandler()
@@ -37,16 +45,116 @@ file_handler = RotatingFileHandler(log_file, maxBytes=1 * 1024 * 1024, backupCou
 file_handler.setLevel(logging.DEBUG)
 file_handler.setFormatter(console_formatter)
 
-logger.addHandler(console_handler)
-logger.addHandler(file_handler)
+# Handlers run on a listener thread so file I/O stays off the main thread
+log_queue = queue.Queue(-1)
+logger.addHandler(QueueHandler(log_queue))
+log_listener = QueueListener(log_queue, console_handler, file_handler, respect_handler_level=True)
+log_listener.start()
+atexit.register(log_listener.stop)
 
 
 WORK_PORTAL_URL = "https://panel.rcponline.pl/login/"
 
+# Persistent Chrome profile so the portal session cookie survives between runs
+PROFILE_DIR = os.path.expanduser("~/.cache/calclick/profile")
+# With several accounts, each gets its own profile in this sibling directory
+PROFILES_DIR = os.path.expanduser("~/.cache/calclick/profiles")
+
+# Pinned chromedriver binary; when unset, the distro package is used if present
+# and otherwise Selenium Manager resolves and caches a matching driver
+CHROMEDRIVER_PATH = os.getenv("CHROMEDRIVER_PATH")
+SYSTEM_CHROMEDRIVER = "/usr/bin/chromedriver"
+
+# A kept-alive session older than this is replaced before the next routine
+DRIVER_MAX_AGE = timedelta(hours=10)
+
+# Page locators, built once at import instead of on every call
+# The submit button closes the login form, so its presence implies both inputs exist
+_LOC_LOGIN_SUBMIT = (By.ID, "kt_login_signin_submit")
+_REMOTE_HOLDER_XPATH = '//*[@id="remote_holder"]/span/span[1]/span'
+_LOC_REMOTE = (By.XPATH, _REMOTE_HOLDER_XPATH)
+_LOC_START = (By.XPATH, "//button[@data-id='1' and contains(@class, 'start-work-button')]")
+_LOC_STOP = (By.XPATH, "//button[@data-id='6' and contains(@class, 'end-work-button')]")
+_LOC_OPTION = {
+    "office": (By.XPATH, "//div[@data-id='0'][contains(text(), 'In the office')]"),
+    "home": (By.XPATH, "//div[@data-id='1'][contains(text(), 'Home office')]"),
+}
+# Elements that only exist once logged in, as one union
+_DASHBOARD_XPATH = " | ".join([_REMOTE_HOLDER_XPATH, _LOC_START[1], _LOC_STOP[1]])
+_LOC_DASHBOARD = (By.XPATH, _DASHBOARD_XPATH)
+# Either the login page or the dashboard has rendered
+_LOC_LANDING = (By.XPATH, "//*[@id='kt_login_signin_submit'] | " + _DASHBOARD_XPATH)
+
+# In-page scripts, kept next to the locators they rely on
+_JS_FILL_LOGIN = (
+    "const u = document.getElementsByName('_username')[0];"
+    "const p = document.getElementsByName('_password')[0];"
+    "u.value = arguments[0];"
+    "p.value = arguments[1];"
+    "u.dispatchEvent(new Event('input', {bubbles: true}));"
+    "p.dispatchEvent(new Event('input', {bubbles: true}));"
+    "document.getElementById('kt_login_signin_submit').click();"
+)
+# Both take the dropdown XPath as arguments[0]
+_JS_FIND_BY_XPATH = (
+    "var el = document.evaluate(arguments[0], document, null,"
+    "    XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;"
+)
+_JS_LOCATION_LABEL = _JS_FIND_BY_XPATH + "return el ? el.textContent.trim().toLowerCase() : null;"
+_JS_OPEN_DROPDOWN = _JS_FIND_BY_XPATH + (
+    "['mousedown', 'mouseup', 'click'].forEach(function (type) {"
+    "    el.dispatchEvent(new MouseEvent(type, {bubbles: true}));"
+    "});"
+)
+
+# Headless unless CALCLICK_HEADLESS=0, e.g. to watch a run under Xvfb or a desktop
+HEADLESS = os.getenv("CALCLICK_HEADLESS", "1") != "0"
+
+# CDP port of the shared Chrome process; routines attach to it as separate tabs
+DEBUG_PORT = int(os.getenv("CALCLICK_DEBUG_PORT", "9222"))
+
+# Resources the bot never reads; CSS stays because the waits depend on visibility
+BLOCKED_URLS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg",
+    "*.woff", "*.woff2", "*.ttf",
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*",
+    "*hotjar.com*", "*facebook.net*",
+]
+
+
+@functools.lru_cache(maxsize=1)
+def _find_chromedriver():
+    """Return the pinned or system chromedriver path, or None to let Selenium Manager pick one"""
+    if CHROMEDRIVER_PATH:
+        # An explicit pin must never fall back to a network lookup
+        if not os.path.exists(CHROMEDRIVER_PATH):
+            raise FileNotFoundError(f"CHROMEDRIVER_PATH points to a missing file: {CHROMEDRIVER_PATH}")
+        return CHROMEDRIVER_PATH
+
+    if os.path.exists(SYSTEM_CHROMEDRIVER):
+        return SYSTEM_CHROMEDRIVER
+    return None
+
+
+def _safe_account_name(username):
+    """Filename-safe form of a username for per-account files"""
+    # Only filename-safe characters, plus a hash so e.g. "a/b" and "a_b" stay apart
+    safe_name = re.sub(r"[^A-Za-z0-9_-]", "_", username)
+    digest = hashlib.sha1(username.encode("utf-8")).hexdigest()[:8]
+    return f"{safe_name}-{digest}"
 
 
 class WorkPortalAutomation:
-    def __init__(self, portal_url, username, password):
+    # Serializes the "attach or launch" decision so concurrent sessions never
+    # start two browsers on one debugging port, and so Selenium Manager's
+    # first-time driver download is not raced by several accounts
+    _launch_lock = threading.Lock()
+
+    # chromedriver and browser paths Selenium Manager resolved for the first session
+    _selenium_manager_path = None
+    _selenium_manager_browser_path = None
+
+    def __init__(self, portal_url, username, password, profile_dir=PROFILE_DIR, debug_port=DEBUG_PORT):
         """
         Initialize the automation system
 
@@ -54,88 +162,202 @@ class WorkPortalAutomation:
             portal_url (str): URL of the work portal
             username (str): Login username
             password (str): Login password
+            profile_dir (str): Chrome user-data-dir holding this account's session
+            debug_port (int): CDP port of this account's Chrome process
         """
         self.portal_url = portal_url
         self.username = username
         self.password = password
+        self.profile_dir = profile_dir
+        self.debug_port = debug_port
         self.driver = None
+        self._driver_started_at = None
+        # False when the session attached to a Chrome this instance did not launch
+        self._launched_chrome = False
+        self._routine_lock = threading.Lock()
+        self._wait_long = None
+        self._wait_short = None
+        self._wait_probe = None
+        self.morning_time = None
+        self.evening_time = None
         self.weekly_schedule = self.generate_weekly_schedule()
 
+        # Resolve the chromedriver binary once; every later session reuses the path
+        self._driver_path = _find_chromedriver()
+        logger.info("Using chromedriver at %s", self._driver_path or "Selenium Manager default")
+
     def generate_weekly_schedule(self):
         """
         Generate random weekly schedule: 3 days office, 2 days home
         Returns dict with day numbers (0=Monday) and location
         """
-        days = [0, 1, 2, 3, 4]  # Monday to Friday
-        random.shuffle(days)
-
-        schedule = {}
-        # First 3 days are office
-        for day in days[:3]:
-            schedule[day] = "office"
-        # Last 2 days are home
-        for day in days[3:]:
-            schedule[day] = "home"
-
-        logger.info(f"Weekly schedule generated: {schedule}")
+        # 3 of the 5 weekdays (0=Monday .. 4=Friday) are office days
+        office_days = set(random.sample(range(5), 3))
+        schedule = {day: ("office" if day in office_days else "home") for day in range(5)}
+
+        logger.info("Weekly schedule generated: %s", schedule)
         return schedule
 
     def setup_driver(self):
-        """Initialize Chrome driver with options"""
+        """Initialize Chrome driver, attaching to an already running Chrome if possible"""
+        with WorkPortalAutomation._launch_lock:
+            self._start_chrome_session()
+
+        # Set default timeouts; readiness is owned by explicit waits only, an
+        # implicit wait would stall every probe for a missing element
+        self.driver.set_page_load_timeout(15)
+        self.driver.implicitly_wait(0)
+
+        # Waits only hold driver + timing config, so build them once per session
+        self._wait_long = WebDriverWait(self.driver, 10, poll_frequency=0.1)
+        self._wait_short = WebDriverWait(self.driver, 5, poll_frequency=0.1)
+        self._wait_probe = WebDriverWait(self.driver, 2, poll_frequency=0.1)
+
+    def _start_chrome_session(self):
+        """Create the WebDriver session, launching Chrome only if none is running"""
         options = webdriver.ChromeOptions()
-        options.add_argument('--no-sandbox')
-        options.add_argument('--disable-dev-shm-usage')
-        options.add_argument('--disable-blink-features=AutomationControlled')
-        options.add_experimental_option("excludeSwitches", ["enable-automation"])
-        options.add_experimental_option('useAutomationExtension', False)
-        options.add_argument("start-maximized")
-        options.add_argument("--disable-gpu")
-        options.add_argument("--disable-extensions")
-        options.add_argument('--disable-notifications')
-        options.add_argument('--disable-popup-blocking')
-        options.add_argument('--no-first-run')
-
-        service = Service(ChromeDriverManager().install())
+        attach = self._cdp_alive()
+
+        if attach:
+            # Reuse the running browser process instead of launching a new one
+            options.add_experimental_option("debuggerAddress", f"127.0.0.1:{self.debug_port}")
+            logger.info("Attaching to running Chrome on port %s", self.debug_port)
+        else:
+            if HEADLESS:
+                options.add_argument('--headless=new')
+            options.add_argument(f'--user-data-dir={self.profile_dir}')
+            options.add_argument(f'--remote-debugging-port={self.debug_port}')
+            options.add_argument('--no-sandbox')
+            options.add_argument('--disable-dev-shm-usage')
+            options.add_argument('--disable-blink-features=AutomationControlled')
+            options.add_experimental_option("excludeSwitches", ["enable-automation"])
+            options.add_experimental_option('useAutomationExtension', False)
+            options.add_argument("--window-size=1600,1000")
+            options.add_argument("--disable-software-rasterizer")
+            options.add_argument("--disable-extensions")
+            options.add_argument('--disable-notifications')
+            options.add_argument('--disable-popup-blocking')
+            options.add_argument('--no-first-run')
+
+            # Skip image decoding and background services the bot never needs
+            options.add_argument('--blink-settings=imagesEnabled=false')
+            options.add_argument('--disable-background-networking')
+            options.add_argument('--disable-sync')
+            options.add_argument('--disable-translate')
+            options.add_argument('--metrics-recording-only')
+            options.add_argument('--mute-audio')
+            options.add_experimental_option("prefs", {
+                "profile.managed_default_content_settings.images": 2,
+                "profile.default_content_setting_values.notifications": 2,
+            })
+
+        # With no path, Selenium Manager resolves the driver; remember what it
+        # found so later sessions skip its subprocess and version lookup
+        driver_path = self._driver_path or WorkPortalAutomation._selenium_manager_path
+
+        # A Service path skips Selenium Manager, which is also what pointed
+        # Chrome at the browser it resolved, so reapply that browser path
+        if (not self._driver_path and driver_path and not attach
+                and WorkPortalAutomation._selenium_manager_browser_path):
+            options.binary_location = WorkPortalAutomation._selenium_manager_browser_path
+
+        service = Service(driver_path)
         self.driver = webdriver.Chrome(service=service, options=options)
+        if driver_path is None:
+            WorkPortalAutomation._selenium_manager_path = service.path
+            WorkPortalAutomation._selenium_manager_browser_path = options.binary_location or None
+        self._driver_started_at = datetime.now()
+        self._launched_chrome = not attach
+
+    def _cdp_alive(self):
+        """Check whether a Chrome DevTools endpoint answers on this account's port"""
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{self.debug_port}/json/version", timeout=2):
+                return True
+        except OSError:
+            return False
+
+    def _ensure_driver(self):
+        """Start the browser on first use and keep it alive across routines"""
+        if self.driver is not None and not self._driver_usable():
+            self.cleanup()
+
+        if self.driver is None or self.driver.session_id is None:
+            self.setup_driver()
+            logger.info("Driver setup complete")
+        else:
+            logger.info("Reusing existing driver session")
+
+    def _driver_usable(self):
+        """Check that the kept-alive session is young enough and still answers"""
+        if datetime.now() - self._driver_started_at >= DRIVER_MAX_AGE:
+            logger.info("Driver session is too old - recycling it")
+            return False
 
-        # Set default timeouts
-        self.driver.set_page_load_timeout(30)
-        self.driver.implicitly_wait(10)
+        if not self._cdp_alive():
+            logger.warning("Chrome stopped responding on the CDP port - restarting it")
+            return False
+
+        try:
+            self.driver.current_url
+        except WebDriverException as e:
+            # Includes InvalidSessionIdException when chromedriver dropped the session
+            logger.warning("Driver session is no longer valid - restarting it: %s", e)
+            return False
+
+        return True
+
+    def _open_tab(self):
+        """Run the routine in a fresh tab of the shared browser"""
+        self.driver.switch_to.new_window('tab')
+
+        # Request blocking is per target, so apply it to every new tab
+        self.driver.execute_cdp_cmd("Network.enable", {})
+        self.driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOCKED_URLS})
+
+    def _close_tab(self):
+        """Close the routine's tab, leaving the browser itself running"""
+        if not self.driver:
+            return
+        try:
+            if len(self.driver.window_handles) > 1:
+                self.driver.close()
+                self.driver.switch_to.window(self.driver.window_handles[0])
+        except WebDriverException as e:
+            logger.warning("Failed to close routine tab: %s", e)
 
     def login(self):
         """Login to the portal"""
         try:
             self.driver.get(self.portal_url)
-            wait = WebDriverWait(self.driver, 10)
-
-            # Wait for login form and ensure we're on login page
-            login_form = wait.until(
-                EC.presence_of_element_located((By.CLASS_NAME, "kt-login_form"))
-            )
-
-            # Find username and password fields directly
-            username_input = self.driver.find_element(By.NAME, "_username")
-            password_input = self.driver.find_element(By.NAME, "_password")
-
-            # Clear and enter username
-            username_input.clear()
-            username_input.send_keys(self.username)
-            logger.info("Username entered")
-
-            # Clear and enter password
-            password_input.clear()
-            password_input.send_keys(self.password)
-            logger.info("Password entered")
-
-            # Find and click login button
-            login_button = self.driver.find_element(By.ID, "kt_login_signin_submit")
-            login_button.click()
-            logger.info("Login button clicked")
-
-            # Wait for redirect
-            wait.until(lambda driver: driver.current_url != self.portal_url)
+            wait = self._wait_long
+
+            # Short probe on a single XPath union: it returns as soon as either the
+            # login form or the dashboard has rendered, so a reused session that
+            # was redirected past the login page does not sit out a timeout
+            try:
+                self._wait_probe.until(EC.presence_of_element_located(_LOC_LANDING))
+            except TimeoutException:
+                pass
+
+            if "login" not in self.driver.current_url.lower():
+                logger.info("Already logged in - skipping login form")
+                return True
+
+            # On the login page, give the form the full timeout
+            wait.until(EC.presence_of_element_located(_LOC_LOGIN_SUBMIT))
+
+            # Fill both fields and submit in a single script call instead of one
+            # WebDriver round-trip per find/clear/keystroke/click; credentials
+            # travel as arguments, input events let the form see the new values
+            self.driver.execute_script(_JS_FILL_LOGIN, self.username, self.password)
+            logger.info("Credentials submitted")
+
+            # Wait for the dashboard to render; a DOM probe instead of
+            # polling current_url, which is one command per poll
+            wait.until(EC.presence_of_element_located(_LOC_DASHBOARD))
             current_url = self.driver.current_url
-            logger.info(f"Current URL after login: {current_url}")
+            logger.info("Current URL after login: %s", current_url)
 
             if "login" not in current_url.lower():
                 logger.info("Login successful - redirected to dashboard")
@@ -145,66 +367,71 @@ class WorkPortalAutomation:
                 return False
 
         except TimeoutException:
-            logger.error("Timeout waiting for redirect after login")
+            logger.error("Timeout waiting for the dashboard after login")
             return False
 
         except Exception as e:
-            logger.error(f"Login error: {str(e)}")
+            logger.error("Login error: %s", e)
             return False
 
-    def click_start_work(self):
-        """Click the start work button"""
+    def _click_when_ready(self, locator, description, confirm_locator):
+        """
+        Wait for a button to become clickable, click it and wait for the portal to react
+        Args:
+            locator (tuple): (By, selector) of the button
+            description (str): Button name used in log messages, e.g. "start"
+            confirm_locator (tuple): (By, selector) of the button the portal shows once the click took effect
+        """
         try:
-            wait = WebDriverWait(self.driver, 10)
-
-            # First make sure the page is fully loaded after location selection
-            time.sleep(2)
+            # The clickable wait covers page readiness, so no fixed pause
+            by, selector = locator
 
-            # Try different selectors for the start button
-            by, selector = (By.XPATH, "//button[@data-id='1' and contains(@class, 'start-work-button')]")
+            try:
+                button = self._wait_long.until(EC.element_to_be_clickable((by, selector)))
+                button.click()
+                logger.info("Successfully clicked %s button using selector: %s", description, selector)
+            except (TimeoutException, NoSuchElementException):
+                logger.error("Could not find or click %s button", description)
+                return False
 
+            # The tab is closed right after the routine, so do not return until the
+            # portal has re-rendered: the clicked button went away or its counterpart appeared
             try:
-                # Try to find the button
-                start_button = wait.until(EC.presence_of_element_located((by, selector)))
-                start_button.click()
-                logger.info(f"Successfully clicked start button using selector: {selector}")
+                self._wait_long.until(EC.any_of(
+                    EC.invisibility_of_element_located(button),
+                    EC.visibility_of_element_located(confirm_locator),
+                ))
+                logger.info("Portal confirmed the %s button click", description)
                 return True
-
-            except (TimeoutException, NoSuchElementException):
-                # If we get here, no button was found
-                logger.error("Could not find or click start button with any selector")
+            except TimeoutException:
+                logger.error("Portal did not react to the %s button click", description)
                 return False
 
         except Exception as e:
-            logger.error(f"Error clicking start work: {str(e)}")
+            logger.error("Error clicking %s button: %s", description, e)
             return False
 
+    def click_start_work(self):
+        """Click the start work button"""
+        return self._click_when_ready(_LOC_START, "start", _LOC_STOP)
+
     def click_stop_work(self):
         """Click the stop work button"""
-        try:
-            wait = WebDriverWait(self.driver, 10)
-
-            # First make sure the page is fully loaded after location selection
-            time.sleep(2)
-
-            # Try different selectors for the start button
-            by, selector = (By.XPATH, "//button[@data-id='6' and contains(@class, 'end-work-button')]")
+        return self._click_when_ready(_LOC_STOP, "stop", _LOC_START)
 
-            try:
-                # Try to find the button
-                stop_button = wait.until(EC.presence_of_element_located((by, selector)))
-                stop_button.click()
-                logger.info(f"Successfully clicked stop button using selector: {selector}")
-                return True
-
-            except (TimeoutException, NoSuchElementException):
-                # If we get here, no button was found
-                logger.error("Could not find or click stop button with any selector")
-                return False
+    def get_current_location(self):
+        """
+        Read the location currently shown in the dropdown
+        Returns:
+            str: "office", "home" or None if the label is missing or unknown
+        """
+        # One script round-trip, no polling: the label text or null if absent
+        text = self.driver.execute_script(_JS_LOCATION_LABEL, _REMOTE_HOLDER_XPATH)
+        if not text:
+            return None
 
-        except Exception as e:
-            logger.error(f"Error clicking stop work: {str(e)}")
-            return False
+        # The only labels are "In the office" and "Home office"
+        return "home" if text.startswith("h") else ("office" if text.startswith("i") else None)
 
     def select_location(self, location):
         """
@@ -213,146 +440,154 @@ class WorkPortalAutomation:
             location (str): "office" or "home"
         """
         try:
-            wait = WebDriverWait(self.driver, 10)
-
-            # Find the dropdown using the exact XPath
-            try:
-                remote_select = wait.until(
-                    EC.presence_of_element_located((By.XPATH, '//*[@id="remote_holder"]/span/span[1]/span'))
-                )
-                logger.info("Found dropdown using exact XPath")
-                remote_select.click()
-                logger.info("Clicked dropdown successfully")
-
-            except (TimeoutException, NoSuchElementException):
-                logger.error("Could not find location dropdown or click it")
-                return False
+            # Open the select2 dropdown in one script call; select2 toggles on
+            # mousedown, so dispatch the full press sequence a real click sends
+            self.driver.execute_script(_JS_OPEN_DROPDOWN, _REMOTE_HOLDER_XPATH)
+            logger.info("Opened location dropdown")
 
-            # Select the appropriate option
-            if location.lower() == "office":
-                option_text = "In the office"
-                data_id = "0"
-            else:
-                option_text = "Home office"
-                data_id = "1"
-
-            # Try to find the option using multiple approaches
-            by, selector = (By.XPATH, f"//div[@data-id='{data_id}'][contains(text(), '{option_text}')]")
+            by, selector = _LOC_OPTION[location]
 
             try:
-                option = wait.until(EC.element_to_be_clickable((by, selector)))
+                option = self._wait_short.until(EC.element_to_be_clickable((by, selector)))
                 option.click()
-                logger.info(f"Selected location '{option_text}' using selector: {selector}")
+
+                # Confirm on the dropdown label instead of pausing before the next click
+                self._wait_short.until(lambda d: self.get_current_location() == location)
+                logger.info("Selected location '%s' using selector: %s", location, selector)
                 return True
 
             except (TimeoutException, NoSuchElementException) as e:
-                logger.error(f"Failed with selector {selector}: {str(e)}")
+                logger.error("Failed with selector %s: %s", selector, e)
                 return False
 
         except Exception as e:
-            logger.error(f"Error in select_location: {str(e)}")
+            logger.error("Error in select_location: %s", e)
             return False
 
+    def _report_error_state(self):
+        """Log the current URL and save a screenshot after a failed routine"""
+        if not self.driver:
+            return
+
+        # Log the current URL to help with debugging
+        try:
+            logger.error("Current URL when error occurred: %s", self.driver.current_url)
+        except WebDriverException as e:
+            # The session died mid-routine; drop it so the next routine starts fresh
+            logger.warning("Driver session lost during the routine - discarding it: %s", e)
+            self.cleanup()
+            return
+
+        # Take screenshot on error, one file per account since accounts run in parallel
+        screenshot = f"error_screenshot_{_safe_account_name(self.username)}.png"
+        try:
+            self.driver.save_screenshot(screenshot)
+            logger.info("Error screenshot saved as %s", screenshot)
+        except Exception as ss_err:
+            logger.error("Failed to save screenshot: %s", ss_err)
+
     def morning_routine(self):
         """Execute morning login routine"""
         today = datetime.now().weekday()
 
-        # Check if it's a business day
-        if today > 4:
+        # Only days in the weekly schedule are business days
+        if today not in self.weekly_schedule:
             logger.info("Weekend - skipping morning routine")
             return
 
-        logger.info("Starting morning routine")
-
-        try:
-            self.setup_driver()
-            logger.info("Driver setup complete")
+        # Decide the location before any browser resources are allocated
+        location = self.weekly_schedule[today]
 
-            if not self.login():
-                raise Exception("Login failed")
-            logger.info("Login successful, waiting for page load")
+        logger.info("Starting morning routine")
 
-            time.sleep(3)  # Wait for page to fully load after login
+        # Routines share one driver, so never let two of them interleave
+        with self._routine_lock:
+            try:
+                self._ensure_driver()
+                self._open_tab()
 
-            location = self.weekly_schedule[today]
-            logger.info(f"Attempting to select location: {location}")
+                if not self.login():
+                    raise Exception("Login failed")
+                logger.info("Login successful, waiting for page load")
 
-            if not self.select_location(location):
-                raise Exception("Failed to select location")
-            logger.info("Location selection successful")
+                # Wait for the rendered location dropdown rather than a fixed pause;
+                # select_location opens it without a wait of its own
+                self._wait_long.until(
+                    EC.presence_of_element_located(_LOC_REMOTE)
+                )
 
-            time.sleep(2)  # Brief pause before clicking start
+                logger.info("Attempting to select location: %s", location)
 
-            if not self.click_start_work():
-                raise Exception("Failed to click start work button")
-            logger.info("Start work button clicked successfully")
+                if not self.select_location(location):
+                    raise Exception("Failed to select location")
+                logger.info("Location selection successful")
 
-            # Keep browser open for a bit, then close
-            time.sleep(5)
+                if not self.click_start_work():
+                    raise Exception("Failed to click start work button")
+                logger.info("Start work button clicked successfully")
 
-        except Exception as e:
-            logger.error(f"Morning routine error: {str(e)}")
-            # Log the current URL to help with debugging
-            if self.driver:
-                logger.error(f"Current URL when error occurred: {self.driver.current_url}")
-                # Take screenshot on error
-                try:
-                    self.driver.save_screenshot("error_screenshot.png")
-                    logger.info("Error screenshot saved as error_screenshot.png")
-                except Exception as ss_err:
-                    logger.error(f"Failed to save screenshot: {str(ss_err)}")
-        finally:
-            if self.driver:
-                self.driver.quit()
+            except Exception as e:
+                logger.error("Morning routine error: %s", e)
+                self._report_error_state()
+            finally:
+                self._close_tab()
 
     def evening_routine(self):
         """Execute evening logout routine"""
         today = datetime.now().weekday()
 
-        # Check if it's a business day
-        if today > 4:
+        # Only days in the weekly schedule are business days
+        if today not in self.weekly_schedule:
             logger.info("Weekend - skipping evening routine")
             return
 
         logger.info("Starting evening routine")
 
-        try:
-            self.setup_driver()
-            logger.info("Driver setup complete")
-
-            if not self.login():
-                raise Exception("Login failed")
-            logger.info("Login successful, waiting for page load")
-
-            time.sleep(3)  # Wait for page to fully load after login
+        # Routines share one driver, so never let two of them interleave
+        with self._routine_lock:
+            try:
+                self._ensure_driver()
+                self._open_tab()
 
-            if not self.click_stop_work():
-                raise Exception("Failed to click stop work button")
-            logger.info("Stop work button clicked successfully")
+                if not self.login():
+                    raise Exception("Login failed")
+                logger.info("Login successful, waiting for page load")
 
-            # Keep browser open for a bit, then close
-            time.sleep(5)
+                if not self.click_stop_work():
+                    raise Exception("Failed to click stop work button")
+                logger.info("Stop work button clicked successfully")
 
-        except Exception as e:
-            logger.error(f"Evening routine error: {str(e)}")
-            # Log the current URL to help with debugging
-            if self.driver:
-                logger.error(f"Current URL when error occurred: {self.driver.current_url}")
-                # Take screenshot on error
-                try:
-                    self.driver.save_screenshot("error_screenshot.png")
-                    logger.info("Error screenshot saved as error_screenshot.png")
-                except Exception as ss_err:
-                    logger.error(f"Failed to save screenshot: {str(ss_err)}")
-        finally:
-            if self.driver:
-                self.driver.quit()
+            except Exception as e:
+                logger.error("Evening routine error: %s", e)
+                self._report_error_state()
+            finally:
+                self._close_tab()
 
+    def run_smoke_test(self):
+        """Run the morning and then the evening routine once, in that order"""
+        # One account, one profile: the routines must not race each other
+        self.morning_routine()
+        self.evening_routine()
 
     def cleanup(self):
         """Cleanup resources"""
         if self.driver:
-            self.driver.quit()
+            # quit() only ends the chromedriver session of an attached browser, which
+            # would then be re-attached on restart and outlive the process
+            if not self._launched_chrome:
+                try:
+                    self.driver.execute_cdp_cmd("Browser.close", {})
+                    # Browser.close returns before Chrome exits; a restart must not re-attach
+                    deadline = time.monotonic() + 5
+                    while self._cdp_alive() and time.monotonic() < deadline:
+                        time.sleep(0.2)
+                except Exception as e:
+                    logger.warning("Error while closing attached Chrome: %s", e)
+            try:
+                self.driver.quit()
+            except Exception as e:
+                logger.warning("Error while closing driver: %s", e)
+            self.driver = None
 
 
 def calculate_random_time(base_hour, base_minute, variance_minutes=30):
@@ -379,66 +614,144 @@ def calculate_random_time(base_hour, base_minute, variance_minutes=30):
     return random_time.strftime("%H:%M:%S")
 
 
-def schedule_tasks(automation):
-    """Schedule daily tasks with random times"""
-    # Clear any existing schedules
-    schedule.clear()
+def _working_days_only(automations, fn):
+    """Wrap a job so it only runs on days present in some weekly schedule"""
+    return lambda: fn() if any(datetime.now().weekday() in a.weekly_schedule for a in automations) else None
 
-    # Generate random times for today
+
+def fanout(automations, attr):
+    """Run the named routine on every account at once, one worker per account"""
+    def run(automation):
+        # Name the worker after its account so parallel log lines can be told apart
+        threading.current_thread().name = automation.username
+        getattr(automation, attr)()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(automations)) as ex:
+        list(ex.map(run, automations))
+
+
+def regenerate_weekly_schedule(automations):
+    """Replace each account's office/home split for the new week"""
+    for automation in automations:
+        automation.weekly_schedule = automation.generate_weekly_schedule()
+
+
+def reroll_daily_times(automations):
+    """Pick new random morning/evening times and move only those two jobs"""
     morning_time = calculate_random_time(9, 0, 30)
     evening_time = calculate_random_time(17, 0, 30)
+    for automation in automations:
+        automation.morning_time = morning_time
+        automation.evening_time = evening_time
 
-    logger.info(f"Today's schedule - Morning: {morning_time}, Evening: {evening_time}")
+    logger.info("Today's schedule - Morning: %s, Evening: %s", morning_time, evening_time)
 
     # Schedule tasks (using only HH:MM part for schedule library compatibility)
     morning_schedule_time = morning_time[:5]  # Get only HH:MM part
     evening_schedule_time = evening_time[:5]  # Get only HH:MM part
 
-    # Schedule morning tasks
-    schedule.every().monday.at(morning_schedule_time).do(automation.morning_routine)
-    schedule.every().tuesday.at(morning_schedule_time).do(automation.morning_routine)
-    schedule.every().wednesday.at(morning_schedule_time).do(automation.morning_routine)
-    schedule.every().thursday.at(morning_schedule_time).do(automation.morning_routine)
-    schedule.every().friday.at(morning_schedule_time).do(automation.morning_routine)
+    # Drop yesterday's routine jobs; the weekly and midnight jobs stay registered
+    schedule.clear('morning')
+    schedule.clear('evening')
+
+    # One daily job per routine; the wrapper skips days without work
+    schedule.every().day.at(morning_schedule_time).do(
+        _working_days_only(automations, lambda: fanout(automations, "morning_routine"))).tag('calclick', 'morning')
+    schedule.every().day.at(evening_schedule_time).do(
+        _working_days_only(automations, lambda: fanout(automations, "evening_routine"))).tag('calclick', 'evening')
 
-    # Schedule evening tasks
-    schedule.every().monday.at(evening_schedule_time).do(automation.evening_routine)
-    schedule.every().tuesday.at(evening_schedule_time).do(automation.evening_routine)
-    schedule.every().wednesday.at(evening_schedule_time).do(automation.evening_routine)
-    schedule.every().thursday.at(evening_schedule_time).do(automation.evening_routine)
-    schedule.every().friday.at(evening_schedule_time).do(automation.evening_routine)
+
+def schedule_tasks(automations):
+    """Schedule daily tasks with random times"""
+    # Clear only our own jobs, so calling this twice never leaves duplicates
+    schedule.clear('calclick')
+
+    reroll_daily_times(automations)
 
     # Regenerate weekly schedule every Monday at midnight
-    schedule.every().monday.at("00:01").do(lambda: automation.generate_weekly_schedule())
+    schedule.every().monday.at("00:01").do(regenerate_weekly_schedule, automations).tag('calclick')
+
+    # Reroll only the routine times every day at midnight
+    schedule.every().day.at("00:00").do(reroll_daily_times, automations).tag('calclick')
 
-    # Reschedule with new random times every day at midnight
-    schedule.every().day.at("00:00").do(lambda: schedule_tasks(automation))
+
+def _profile_dir_for(username):
+    """Per-account Chrome profile under PROFILES_DIR, named safely after the username"""
+    return os.path.join(PROFILES_DIR, _safe_account_name(username))
+
+
+def build_automations():
+    """
+    Create one WorkPortalAutomation per configured account
+
+    CALCLICK_USERS/CALCLICK_PASSES take comma-separated lists; the single
+    CALCLICK_USER/CALCLICK_PASS pair is used when they are not set. Empty
+    entries, e.g. from a trailing comma, are ignored.
+    """
+    users = [u.strip() for u in os.getenv("CALCLICK_USERS", os.getenv("CALCLICK_USER", "")).split(",")]
+    users = [u for u in users if u]
+    passes = [p for p in os.getenv("CALCLICK_PASSES", os.getenv("CALCLICK_PASS", "")).split(",") if p.strip()]
+    if not users:
+        raise ValueError("No account configured: set CALCLICK_USER/CALCLICK_PASS or CALCLICK_USERS/CALCLICK_PASSES")
+    if len(users) != len(passes):
+        raise ValueError("CALCLICK_USERS and CALCLICK_PASSES must list the same number of accounts")
+
+    if len(users) == 1:
+        return [WorkPortalAutomation(WORK_PORTAL_URL, users[0], passes[0])]
+
+    # Separate profile and debugging port per account so sessions never share cookies
+    return [
+        WorkPortalAutomation(
+            WORK_PORTAL_URL, username, password,
+            profile_dir=_profile_dir_for(username),
+            debug_port=DEBUG_PORT + i,
+        )
+        for i, (username, password) in enumerate(zip(users, passes))
+    ]
 
 
 def main():
     """Main application entry point"""
-    # IMPORTANT: Update these with your actual credentials and URL
-    username = os.getenv("CALCLICK_USER")
-    password = os.getenv("CALCLICK_PASS")
-
     logger.info("Starting Work Portal Automation System")
 
-    # Initialize automation
-    automation = WorkPortalAutomation(WORK_PORTAL_URL, username, password)
+    # Initialize automation, one instance per account
+    automations = build_automations()
+
+    # The browser now outlives single routines, so close it on any exit path
+    for automation in automations:
+        atexit.register(automation.cleanup)
+
+    # SIGTERM wakes the scheduler loop immediately instead of after its sleep
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+
+    # Optional one-off run of both routines to verify the setup end to end
+    if os.getenv("CALCLICK_SMOKE_TEST") == "1":
+        # Accounts have separate profiles and browsers, so only they run in parallel
+        fanout(automations, "run_smoke_test")
 
     # Schedule tasks
-    schedule_tasks(automation)
+    schedule_tasks(automations)
 
     logger.info("Scheduler initialized. Running...")
 
     # Run scheduler loop
     try:
-        while True:
+        while not stop_event.is_set():
+            # Block until the next job is due; the cap re-checks the job list hourly
+            n = schedule.idle_seconds()
+            if n is None:
+                stop_event.wait(timeout=3600)
+                continue
+            if n > 0 and stop_event.wait(timeout=min(n, 3600)):
+                break
             schedule.run_pending()
-            time.sleep(60)  # Check every minute
+        logger.info("Shutting down...")
     except KeyboardInterrupt:
         logger.info("Shutting down...")
-        automation.cleanup()
+    finally:
+        for automation in automations:
+            automation.cleanup()
 
 
 if __name__ == "__main__":